@@ -1,48 +1,53 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import joblib
-import cloudpickle
-import pickle
-from sklearn.preprocessing import LabelEncoder
-import os
-from pathlib import Path
+import secrets
 
 # Import our custom modules
 from config import *
-from utils import SecurityUtils, DatabaseUtils, log_user_action, validate_input, logger
+from utils import SecurityUtils, DatabaseUtils, LoginRateLimiter, log_user_action, validate_input, logger
+from db import SQL_USERNAMES, get_pool, seed_users, init_db
+from engine import load_scoring_pipeline, run_decision_engine
+
+# SQL kept as module constants so every call hits the same entry in the
+# connection's prepared-statement cache
+SQL_CREATE_USERS = '''CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('admin', 'officer')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP
+)'''
+SQL_INSERT_USER = "INSERT INTO users (username, password, role) VALUES (?, ?, ?)"
+# bcrypt runs in Python between these two, outside any transaction, so
+# concurrent logins don't queue on SQLite's write lock
+SQL_LOGIN = "SELECT password, role FROM users WHERE username = ?"
+SQL_STAMP_LOGIN = "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?"
+SQL_ALL_USERS = "SELECT username, role, created_at, last_login FROM users ORDER BY username"
+SQL_DELETE_USER = "DELETE FROM users WHERE username = ?"
 
 # ------------------ DATABASE ------------------
-def create_user_table():
-    """Create users table with enhanced security"""
+def create_user_table(seed_rows=None):
+    """Create users table and seed (username, password, role) rows, default admin by default"""
+    if seed_rows is None:
+        seed_rows = [(DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD, 'admin')]
     try:
-        query = '''CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK (role IN ('admin', 'officer')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        )'''
-        DatabaseUtils.execute_query(query)
+        DatabaseUtils.execute_query(SQL_CREATE_USERS)
         
-        # 🔐 Seed default admin if not exists
-        existing_admin = DatabaseUtils.execute_query(
-            "SELECT username FROM users WHERE username = ?", 
-            (DEFAULT_ADMIN_USERNAME,), 
-            fetch_one=True
-        )
+        # 🔐 Seed users that don't exist yet, in one transaction
+        created = seed_users(get_pool(), seed_rows, SecurityUtils.hash_password)
         
-        if not existing_admin:
-            hashed_password = SecurityUtils.hash_password(DEFAULT_ADMIN_PASSWORD)
-            DatabaseUtils.execute_query(
-                "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                (DEFAULT_ADMIN_USERNAME, hashed_password, 'admin')
-            )
-            logger.info(f"Default admin user '{DEFAULT_ADMIN_USERNAME}' created")
+        if created:
+            get_all_users.clear()
+            get_known_usernames.clear()
+            logger.info(f"Seeded {created} default user(s)")
+        
+        # Refresh planner statistics (sqlite_stat1) for the users table
+        DatabaseUtils.execute_query("ANALYZE users")
+        return True
             
     except Exception as e:
         logger.error(f"Error creating user table: {e}")
         st.error("Database initialization failed. Please check logs.")
+        return False
 
 def add_user(username, password, role):
     """Add user with hashed password"""
@@ -58,11 +63,10 @@ def add_user(username, password, role):
         hashed_password = SecurityUtils.hash_password(password)
         
         # Insert user
-        DatabaseUtils.execute_query(
-            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-            (username, hashed_password, role)
-        )
+        DatabaseUtils.execute_query(SQL_INSERT_USER, (username, hashed_password, role))
         
+        get_all_users.clear()
+        get_known_usernames.clear()
         log_user_action(st.session_state.get('username', 'system'), 'USER_CREATED', f"Created user: {username}")
         return True, "User created successfully"
         
@@ -70,25 +74,56 @@ def add_user(username, password, role):
         logger.error(f"Error adding user {username}: {e}")
         return False, "Username already exists or database error"
 
+@st.cache_resource
+def get_login_rate_limiter():
+    """Failed-login tracker shared by all sessions in this process"""
+    return LoginRateLimiter()
+
+@st.cache_resource(ttl=30, show_spinner=False)
+def get_known_usernames():
+    """In-memory set of registered usernames, refreshed after user changes"""
+    # Read directly rather than from get_all_users, whose own TTL would
+    # let a rebuilt set be up to two TTLs stale
+    try:
+        rows = DatabaseUtils.execute_query(SQL_USERNAMES, fetch_all=True, readonly=True)
+        return {row['username'] for row in rows}
+    except Exception as e:
+        logger.error(f"Error fetching usernames: {e}")
+        return set()
+
+@st.cache_resource(show_spinner=False)
+def get_dummy_password_hash():
+    """Hash checked for unknown usernames so they cost the same bcrypt work"""
+    return SecurityUtils.hash_password(secrets.token_hex(16))
+
 def login_user(username, password):
     """Authenticate user with hashed password"""
+    limiter = get_login_rate_limiter()
+    if limiter.is_blocked(username):
+        log_user_action(username, 'LOGIN_BLOCKED', "Too many failed attempts")
+        return None
+    
+    # Unknown usernames are rejected without a DB round-trip; an empty set
+    # means the user list couldn't be read, so fall through to the DB then.
+    # Failures are recorded like a known user's so lockout timing doesn't
+    # reveal which names exist; the limiter prunes them after the window
+    known_usernames = get_known_usernames()
+    if known_usernames and username not in known_usernames:
+        SecurityUtils.verify_password(password, get_dummy_password_hash())
+        limiter.record_failure(username)
+        log_user_action(username, 'LOGIN_FAILED', "Unknown username")
+        return None
+    
     try:
-        user = DatabaseUtils.execute_query(
-            "SELECT password, role FROM users WHERE username = ?",
-            (username,),
-            fetch_one=True
-        )
+        user = DatabaseUtils.execute_query(SQL_LOGIN, (username,), fetch_one=True, readonly=True)
         
         if user and SecurityUtils.verify_password(password, user['password']):
-            # Update last login
-            DatabaseUtils.execute_query(
-                "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?",
-                (username,)
-            )
-            
+            DatabaseUtils.execute_query(SQL_STAMP_LOGIN, (username,))
+            limiter.reset(username)
             log_user_action(username, 'LOGIN_SUCCESS', "User logged in")
             return user['role']
         
+        limiter.record_failure(username)
         log_user_action(username, 'LOGIN_FAILED', "Invalid credentials")
         return None
         
@@ -96,13 +131,11 @@ def login_user(username, password):
         logger.error(f"Login error for user {username}: {e}")
         return None
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_all_users():
     """Get all users with enhanced error handling"""
     try:
-        users = DatabaseUtils.execute_query(
-            "SELECT username, role, created_at, last_login FROM users ORDER BY username",
-            fetch_all=True
-        )
+        users = DatabaseUtils.execute_query(SQL_ALL_USERS, fetch_all=True, readonly=True)
         return [dict(user) for user in users] if users else []
     except Exception as e:
         logger.error(f"Error fetching users: {e}")
@@ -114,12 +147,11 @@ def delete_user(username):
         if username == DEFAULT_ADMIN_USERNAME:
             return False, "Cannot delete default admin user"
         
-        rows_affected = DatabaseUtils.execute_query(
-            "DELETE FROM users WHERE username = ?", 
-            (username,)
-        )
+        rows_affected = DatabaseUtils.execute_query(SQL_DELETE_USER, (username,))
         
         if rows_affected > 0:
+            get_all_users.clear()
+            get_known_usernames.clear()
             log_user_action(st.session_state.get('username', 'system'), 'USER_DELETED', f"Deleted user: {username}")
             return True, "User deleted successfully"
         else:
@@ -129,103 +161,6 @@ def delete_user(username):
         logger.error(f"Error deleting user {username}: {e}")
         return False, "Database error occurred"
 
-# ------------------ MODEL ------------------
-@st.cache_resource
-def load_model():
-    try:
-        return joblib.load("credit_scoring_stacked_model.pkl")
-    except FileNotFoundError:
-        st.error("Model file not found. Please ensure 'credit_scoring_stacked_model.pkl' is in the app directory.")
-        return None
-    except Exception as e:
-        st.error(f"Error loading model: {e}")
-        return None
-
-# ------------------ DECISION ENGINE ------------------
-def map_probability_to_score(prob, min_score=300, max_score=800):
-    return int(min_score + prob * (max_score - min_score))
-
-def decision_logic(prob, income, repayment_history, has_collateral, missing_docs=False):
-    credit_score = map_probability_to_score(prob)
-
-    if credit_score >= 700 and repayment_history == 'good':
-        decision = 'Approved'
-    elif credit_score >= 600 and repayment_history in ['good', 'average'] and has_collateral:
-        decision = 'Approved'
-    elif 500 <= credit_score < 600 or repayment_history == 'average':
-        decision = 'Review'
-    else:
-        decision = 'Rejected'
-
-    if missing_docs:
-        decision = 'Review'
-
-    return credit_score, decision
-
-def estimate_loan_amount(income, credit_score):
-    if credit_score >= 750:
-        multiplier = 3.0
-    elif credit_score >= 700:
-        multiplier = 2.5
-    elif credit_score >= 650:
-        multiplier = 2.0
-    elif credit_score >= 600:
-        multiplier = 1.5
-    else:
-        multiplier = 1.0
-
-    return round(income * multiplier, -3)
-
-def generate_message(decision, credit_score, amount=None):
-    if decision == 'Approved':
-        return f"✅ Congratulations! Your loan has been approved with a credit score of {credit_score}. The approved loan amount is **KES {amount:,.0f}**."
-    elif decision == 'Review':
-        return f"📋 Your loan application is under review. A loan officer will contact you shortly. (Credit score: {credit_score})"
-    else:
-        return f"❌ We're sorry, your loan application was not approved at this time. (Credit score: {credit_score})"
-
-def run_decision_engine(model, input_df):
-    if model is None:
-        return None
-
-    # Load and apply preprocessing pipeline
-    try:
-        pipeline = joblib.load("preprocessing_pipeline.pkl")
-        input_transformed = pipeline.transform(input_df)
-    except Exception as e:
-        st.error(f"Error loading or applying preprocessing pipeline: {e}")
-        return None
-
-    # Predict probability
-    try:
-        prob = model.predict_proba(input_transformed)[0][1]
-    except Exception as e:
-        st.error(f"Prediction error: {e}")
-        return None
-
-    # Use original (non-transformed) values for logic decisions
-    income = input_df['monthly_income'].values[0]
-    repayment_history = input_df['repayment_history'].values[0]
-    has_collateral = input_df['has_collateral'].values[0]
-    missing_docs = input_df['missing_documents'].values[0]
-
-    # Business logic
-    credit_score, decision = decision_logic(prob, income, repayment_history, has_collateral, missing_docs)
-
-    approved_loan_amount = None
-    if decision == 'Approved':
-        approved_loan_amount = estimate_loan_amount(income, credit_score)
-
-    message = generate_message(decision, credit_score, approved_loan_amount)
-
-    return {
-        'credit_score': credit_score,
-        'decision': decision,
-        'loan_amount': approved_loan_amount,
-        'probability': round(prob, 4),
-        'message': message
-    }
-
 # ------------------ UI FUNCTIONS ------------------
 def login_page():
     st.title("🏦 Credit Scoring System Login")
@@ -243,6 +178,7 @@ def login_page():
                     st.session_state.logged_in = True
                     st.session_state.username = username
                     st.session_state.role = role
+                    st.session_state.auth_token = SecurityUtils.create_session_token(username)
                     st.success(f"Welcome {username}!")
                     st.rerun()
                 else:
@@ -250,13 +186,19 @@ def login_page():
             else:
                 st.warning("Please enter both username and password")
 
+def has_valid_session():
+    """True while the session's signed token is valid for its username"""
+    return SecurityUtils.verify_session_token(
+        st.session_state.get('auth_token', ''), st.session_state.get('username', ''))
+
 def logout():
     st.session_state.logged_in = False
     st.session_state.username = ""
     st.session_state.role = ""
+    st.session_state.auth_token = ""
     st.rerun()
 
-def loan_application():
+def loan_application(model):
     st.title("💰 Loan Application")
     st.write("Please fill in the following details for your loan application:")
 
@@ -282,12 +224,7 @@ def loan_application():
         submitted = st.form_submit_button("Submit Application")
         
         if submitted:
-            model = load_model()
-            if model is None:
-                st.error("Unable to process application. Model not available.")
-                return
-                
-            input_data = pd.DataFrame([{
+            application = {
                 'Age_Group': age,
                 'Gender': gender,
                 'Region': region,
@@ -300,20 +237,29 @@ def loan_application():
                 'repayment_history': repayment,
                 'has_collateral': collateral,
                 'missing_documents': missing_docs
-            }])
+            }
 
-            # Encode categorical variables
-            for col in input_data.select_dtypes(include='object').columns:
-                le = LabelEncoder()
-                input_data[col] = le.fit_transform(input_data[col])
-
-            results = run_decision_engine(model, input_data)
+            # Re-submitting identical inputs reuses the previous result
+            application_key = tuple(application.items())
+            if st.session_state.get('last_application_key') == application_key:
+                results = st.session_state.last_application_result
+            else:
+                if model is None:
+                    st.error("Unable to process application. Model not available.")
+                    return
+
+                with st.spinner("Scoring application..."):
+                    results = run_decision_engine(model, application)
+                if results:
+                    st.session_state.last_application_key = application_key
+                    st.session_state.last_application_result = results
             
             if results:
                 st.markdown("---")
                 st.subheader("📋 Decision Result")
                 st.markdown(results['message'])
-                st.info(f"**Probability of Approval:** {results['probability']*100:.2f}%")
+                if results['probability'] is not None:
+                    st.info(f"**Probability of Approval:** {results['probability']*100:.2f}%")
 
                 # Officer override option
                 if st.session_state.role == "officer" and results['decision'] == 'Review':
@@ -323,70 +269,87 @@ def loan_application():
                         if st.button("Confirm Override"):
                             st.success(f"✅ Decision overridden to: {override}")
 
-def admin_dashboard():
+# Fragment: user admin interactions rerun this block only, not the loan pane
+@st.fragment
+def user_management():
+    # Fragment reruns skip main(), so the session token is checked here too;
+    # a full rerun then sends an expired session to the login page
+    if not has_valid_session():
+        st.session_state.logged_in = False
+        st.rerun()
+
+    st.subheader("Add New User")
+
+    with st.form("add_user_form", clear_on_submit=True):
+        new_username = st.text_input("Username")
+        new_password = st.text_input("Password", type="password")
+        role = st.selectbox("Role", ["admin", "officer"])
+        add_submitted = st.form_submit_button("Add User")
+
+        if add_submitted:
+            if new_username and new_password:
+                success, message = add_user(new_username, new_password, role)
+                if success:
+                    st.success(f"✅ {message}")
+                    st.rerun(scope="fragment")
+                else:
+                    st.error(f"❌ {message}")
+            else:
+                st.warning("Please fill in all fields")
+
+    st.markdown("---")
+    st.subheader("Current Users")
+    users = get_all_users()
+
+    if users:
+        for i, user_data in enumerate(users):
+            username = user_data['username']
+            user_role = user_data['role']
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col1:
+                st.write(f"**{username}** ({user_role})")
+            with col2:
+                st.write("🔒 Admin" if user_role == "admin" else "👤 Officer")
+            with col3:
+                if username != DEFAULT_ADMIN_USERNAME:  # Prevent deleting the default admin
+                    if st.button("🗑️ Delete", key=f"delete_{username}_{i}"):
+                        success, message = delete_user(username)
+                        if success:
+                            st.success(f"✅ {message}")
+                            st.rerun(scope="fragment")
+                        else:
+                            st.error(f"❌ {message}")
+            st.markdown("---")
+    else:
+        st.info("No users found")
+
+def admin_dashboard(model):
     st.title("👨‍💼 Admin Dashboard")
     
     tab1, tab2 = st.tabs(["👥 User Management", "💼 Loan Application"])
     
     with tab1:
-        st.subheader("Add New User")
-        
-        with st.form("add_user_form"):
-            new_username = st.text_input("Username")
-            new_password = st.text_input("Password", type="password")
-            role = st.selectbox("Role", ["admin", "officer"])
-            add_submitted = st.form_submit_button("Add User")
-            
-            if add_submitted:
-                if new_username and new_password:
-                    success, message = add_user(new_username, new_password, role)
-                    if success:
-                        st.success(f"✅ {message}")
-                        st.rerun()
-                    else:
-                        st.error(f"❌ {message}")
-                else:
-                    st.warning("Please fill in all fields")
-
-        st.markdown("---")
-        st.subheader("Current Users")
-        users = get_all_users()
-        
-        if users:
-            for i, user_data in enumerate(users):
-                username = user_data['username']
-                user_role = user_data['role']
-                col1, col2, col3 = st.columns([2, 1, 1])
-                with col1:
-                    st.write(f"**{username}** ({user_role})")
-                with col2:
-                    st.write("🔒 Admin" if user_role == "admin" else "👤 Officer")
-                with col3:
-                    if username != DEFAULT_ADMIN_USERNAME:  # Prevent deleting the default admin
-                        if st.button("🗑️ Delete", key=f"delete_{username}_{i}"):
-                            success, message = delete_user(username)
-                            if success:
-                                st.success(f"✅ {message}")
-                                st.rerun()
-                            else:
-                                st.error(f"❌ {message}")
-                st.markdown("---")
-        else:
-            st.info("No users found")
+        user_management()
     
     with tab2:
-        loan_application()
+        loan_application(model)
 
 # ------------------ MAIN ------------------
 def main():
     # Initialize database
-    create_user_table()
+    init_db(create_user_table)
     
     # Initialize session state
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
         st.session_state.username = ""
         st.session_state.role = ""
+        st.session_state.auth_token = ""
+
+    # Reruns trust the signed session token instead of re-authenticating;
+    # an expired or tampered token sends the user back to the login page
+    if st.session_state.logged_in and not has_valid_session():
+        st.session_state.logged_in = False
 
     # Main app logic
     if not st.session_state.logged_in:
@@ -400,11 +363,15 @@ def main():
             if st.button("🚪 Logout", type="primary"):
                 logout()
 
+        # Load model artifacts up front so the first submission doesn't pay
+        # for unpickling; the loaders are process-wide singletons
+        model = load_scoring_pipeline()
+
         # Main content based on role
         if st.session_state.role == "admin":
-            admin_dashboard()
+            admin_dashboard(model)
         elif st.session_state.role == "officer":
-            loan_application()
+            loan_application(model)
 
 if __name__ == "__main__":
     main()
@@ -8,6 +8,14 @@ DB_PATH = Path(DB_FILE)
 # Security configuration
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'bcrypt').lower()
+PASSWORD_HASHERS = ('bcrypt', 'argon2id')
+if PASSWORD_HASHER not in PASSWORD_HASHERS:
+    # A typo must not silently fall back to another scheme
+    raise ValueError(f"PASSWORD_HASHER must be one of {PASSWORD_HASHERS}, got {PASSWORD_HASHER!r}")
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '28800'))
+LOGIN_MAX_ATTEMPTS = int(os.getenv('LOGIN_MAX_ATTEMPTS', '5'))
+LOGIN_LOCKOUT_SECONDS = int(os.getenv('LOGIN_LOCKOUT_SECONDS', '300'))
 
 # Default admin credentials (change in production)
 DEFAULT_ADMIN_USERNAME = os.getenv('DEFAULT_ADMIN_USERNAME', 'admin')
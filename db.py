@@ -0,0 +1,194 @@
+import streamlit as st
+import sqlite3
+import bcrypt
+import queue
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import DB_FILE, BCRYPT_ROUNDS, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD
+
+# SQL kept as module constants so every call hits the same entry in the
+# connection's prepared-statement cache
+SQL_CREATE_USERS = '''CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('admin', 'officer')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+SQL_INSERT_USER = "INSERT INTO users (username, password, role) VALUES (?, ?, ?)"
+SQL_LOGIN = "SELECT password, role FROM users WHERE username = ?"
+SQL_ALL_USERS = "SELECT username, role FROM users ORDER BY username"
+SQL_DELETE_USER = "DELETE FROM users WHERE username = ?"
+SQL_USERNAMES = "SELECT username FROM users"
+# Rows are hashed before this runs; OR IGNORE covers a concurrent insert
+SQL_SEED_USER = "INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, ?)"
+
+# ------------------ CONNECTIONS ------------------
+class SqlitePool:
+    """One read-write connection plus a few read-only ones, shared by all sessions"""
+    
+    def __init__(self, db_file, readers=4):
+        self._writer = queue.LifoQueue(maxsize=1)
+        self._readers = queue.LifoQueue(maxsize=readers)
+        
+        # The writer goes first so the file exists and is in WAL mode, which
+        # lets the read-only connections read while a write is in progress
+        writer = self._connect(db_file)
+        writer.executescript('''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+        ''')
+        self._writer.put(writer)
+        
+        read_uri = Path(db_file).resolve().as_uri() + '?mode=ro'
+        for _ in range(readers):
+            self._readers.put(self._connect(read_uri, uri=True))
+    
+    @staticmethod
+    def _connect(database, uri=False):
+        conn = sqlite3.connect(database, uri=uri, check_same_thread=False,
+                               isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.executescript('''
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-64000;
+        ''')
+        return conn
+    
+    @contextmanager
+    def acquire(self, readonly=False):
+        """Borrow a connection; the single writer also serializes writes"""
+        pool = self._readers if readonly else self._writer
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+
+@st.cache_resource
+def get_pool(db_file=DB_FILE):
+    """Connection pool shared by every session and rerun in this process"""
+    return SqlitePool(db_file)
+
+def seed_users(pool, seed_rows, hash_password):
+    """Insert (username, password, role) rows that don't exist yet; returns the count added"""
+    with pool.acquire(readonly=True) as c:
+        existing = {row[0] for row in c.execute(SQL_USERNAMES)}
+    
+    # Hash in Python, outside any transaction, so bcrypt never runs while
+    # the single writer and SQLite's write lock are held
+    new_rows = [(username, hash_password(password), role)
+                for username, password, role in seed_rows if username not in existing]
+    if not new_rows:
+        return 0
+    
+    with pool.acquire() as c:
+        with c:
+            c.execute("BEGIN")
+            return c.executemany(SQL_SEED_USER, new_rows).rowcount
+
+# ------------------ USER STORE ------------------
+# Used by app.py / app_simple.py; app_complex.py keeps its own schema and
+# queries through utils.DatabaseUtils on the same pool
+def hash_password(password: str) -> str:
+    """Hash a password using bcrypt"""
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+    return hashed.decode('utf-8')
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Verify a password against its hash"""
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except:
+        return False
+
+def create_user_table(seed_rows=None):
+    """Create users table and seed (username, password, role) rows, default admin by default"""
+    if seed_rows is None:
+        seed_rows = [(DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_PASSWORD, 'admin')]
+    try:
+        pool = get_pool()
+        with pool.acquire() as c:
+            c.execute(SQL_CREATE_USERS)
+        
+        # Seed missing users in a single transaction (one fsync)
+        seed_users(pool, seed_rows, hash_password)
+        
+        with pool.acquire() as c:
+            # Refresh planner statistics (sqlite_stat1) for the users table
+            c.execute("ANALYZE users")
+        return True
+    except Exception as e:
+        st.error(f"Database initialization failed: {e}")
+        return False
+
+@st.cache_resource
+def get_db_status():
+    """Process-wide record of whether the users table has been set up"""
+    return {'initialized': False}
+
+def init_db(create_table=create_user_table):
+    """Create and seed the users table once per process, retrying after a failure"""
+    status = get_db_status()
+    if not status['initialized']:
+        status['initialized'] = create_table()
+
+def add_user(username, password, role):
+    """Add user with hashed password"""
+    try:
+        if not username or not password or not role:
+            return False, "All fields are required"
+        
+        if role not in ['admin', 'officer']:
+            return False, "Invalid role"
+        
+        hashed_password = hash_password(password)
+        with get_pool().acquire() as c:
+            c.execute(SQL_INSERT_USER, (username, hashed_password, role))
+        get_all_users.clear()
+        return True, "User created successfully"
+    except sqlite3.IntegrityError:
+        return False, "Username already exists"
+    except Exception as e:
+        return False, f"Database error: {e}"
+
+def login_user(username, password):
+    """Authenticate user with hashed password"""
+    try:
+        with get_pool().acquire(readonly=True) as c:
+            result = c.execute(SQL_LOGIN, (username,)).fetchone()
+        
+        if result and verify_password(password, result[0]):
+            return result[1]  # Return role
+        return None
+    except Exception as e:
+        st.error(f"Login error: {e}")
+        return None
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_all_users():
+    """Get all users"""
+    try:
+        with get_pool().acquire(readonly=True) as c:
+            return [tuple(row) for row in c.execute(SQL_ALL_USERS).fetchall()]
+    except Exception as e:
+        st.error(f"Error fetching users: {e}")
+        return []
+
+def delete_user(username):
+    """Delete user"""
+    try:
+        if username == DEFAULT_ADMIN_USERNAME:
+            return False, "Cannot delete default admin user"
+        
+        with get_pool().acquire() as c:
+            rows_affected = c.execute(SQL_DELETE_USER, (username,)).rowcount
+        
+        if rows_affected > 0:
+            get_all_users.clear()
+            return True, "User deleted successfully"
+        else:
+            return False, "User not found"
+    except Exception as e:
+        return False, f"Database error: {e}"
@@ -0,0 +1,254 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import joblib
+import os
+import bisect
+
+from config import MODEL_PATH, PIPELINE_PATH
+
+# ------------------ MODEL ------------------
+def prefetch_file(path):
+    """Ask the kernel to start reading a file into the page cache"""
+    if not hasattr(os, 'posix_fadvise'):  # Not available on Windows/macOS
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # The loader reports missing files
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@st.cache_resource(show_spinner=False)
+def load_model():
+    try:
+        # The model's ndarrays (e.g. the linear meta-learner) stay read-only
+        # and file-backed on every start; the boosters' trees are native
+        # blobs and are always loaded into memory
+        model = joblib.load(MODEL_PATH, mmap_mode='r')
+    except FileNotFoundError:
+        st.error(f"Model file not found. Please ensure '{MODEL_PATH}' is in the app directory.")
+        return None
+    except Exception as e:
+        st.error(f"Error loading model: {e}")
+        return None
+
+    # Scoring is one row at a time, where thread-pool start-up in the
+    # boosted base learners costs more than walking the trees
+    for estimator in getattr(model, 'estimators_', []):
+        if 'n_jobs' in estimator.get_params():
+            estimator.set_params(n_jobs=1)
+    return model
+
+@st.cache_resource(show_spinner=False)
+def load_pipeline():
+    try:
+        # Fitted arrays stay file-backed and shared between worker processes
+        return joblib.load(PIPELINE_PATH, mmap_mode='r')
+    except FileNotFoundError:
+        st.error(f"Preprocessing pipeline not found. Please ensure '{PIPELINE_PATH}' is in the app directory.")
+        return None
+    except Exception as e:
+        st.error(f"Error loading preprocessing pipeline: {e}")
+        return None
+
+@st.cache_resource(show_spinner=False)
+def load_scoring_pipeline():
+    """Preprocessing and stacked model fused into a single estimator"""
+    # Imported here so the login page renders without pulling in sklearn
+    from sklearn.pipeline import Pipeline
+
+    # Start readahead on both files so the model's pages are already
+    # arriving while the pipeline is unpickled, and mmap'd arrays fault in
+    # from the page cache rather than disk
+    for path in (PIPELINE_PATH, MODEL_PATH):
+        prefetch_file(path)
+
+    pipeline = load_pipeline()
+    model = load_model()
+    if pipeline is None or model is None:
+        return None
+    return Pipeline([('pre', pipeline), ('clf', model)])
+
+# ------------------ DECISION ENGINE ------------------
+MIN_CREDIT_SCORE = 300
+MAX_CREDIT_SCORE = 800
+CREDIT_SCORE_RANGE = MAX_CREDIT_SCORE - MIN_CREDIT_SCORE
+
+def map_probability_to_score(prob, min_score=MIN_CREDIT_SCORE, max_score=MAX_CREDIT_SCORE):
+    return int(min_score + prob * (max_score - min_score))
+
+# Repayment history is compared as an ordered integer code; anything
+# unrecognised is treated like 'poor', as the string checks did
+REPAYMENT_POOR = 0
+REPAYMENT_AVERAGE = 1
+REPAYMENT_GOOD = 2
+REPAYMENT_CODES = {'poor': REPAYMENT_POOR, 'average': REPAYMENT_AVERAGE, 'good': REPAYMENT_GOOD}
+
+def decision_logic(prob, income, repayment_code, has_collateral, missing_docs=False):
+    # Default score range inlined: this runs on every application
+    credit_score = int(MIN_CREDIT_SCORE + prob * CREDIT_SCORE_RANGE)
+
+    if credit_score >= 700 and repayment_code == REPAYMENT_GOOD:
+        decision = 'Approved'
+    elif credit_score >= 600 and repayment_code >= REPAYMENT_AVERAGE and has_collateral:
+        decision = 'Approved'
+    elif 500 <= credit_score < 600 or repayment_code == REPAYMENT_AVERAGE:
+        decision = 'Review'
+    else:
+        decision = 'Rejected'
+
+    if missing_docs:
+        decision = 'Review'
+
+    return credit_score, decision
+
+# Credit score floors and the income multiplier applied from each floor up
+LOAN_SCORE_THRESHOLDS = (600, 650, 700, 750)
+LOAN_MULTIPLIERS = (1.0, 1.5, 2.0, 2.5, 3.0)
+LOAN_SCORE_TABLE = np.array(LOAN_SCORE_THRESHOLDS)
+LOAN_MULTIPLIER_TABLE = np.array(LOAN_MULTIPLIERS)
+
+def estimate_loan_amount(income, credit_score):
+    multiplier = LOAN_MULTIPLIERS[bisect.bisect_right(LOAN_SCORE_THRESHOLDS, credit_score)]
+    return round(income * multiplier, -3)
+
+# Array versions of the rules above for scoring many applications at once;
+# the scalar functions stay plain Python for the single-application path
+def decision_logic_batch(probs, repayment_codes, has_collateral, missing_docs):
+    probs = np.asarray(probs, dtype=np.float64)
+    repayment_codes = np.asarray(repayment_codes)
+    # One scratch array, offset in place, instead of a temporary per operator
+    credit_scores = probs * CREDIT_SCORE_RANGE
+    credit_scores += MIN_CREDIT_SCORE
+    credit_scores = credit_scores.astype(np.int64)
+
+    good = repayment_codes == REPAYMENT_GOOD
+    average = repayment_codes == REPAYMENT_AVERAGE
+    approved = ((credit_scores >= 700) & good) | \
+        ((credit_scores >= 600) & (repayment_codes >= REPAYMENT_AVERAGE) & np.asarray(has_collateral, dtype=bool))
+    review = ((credit_scores >= 500) & (credit_scores < 600)) | average
+
+    decisions = np.where(approved, 'Approved', np.where(review, 'Review', 'Rejected'))
+    decisions = np.where(np.asarray(missing_docs, dtype=bool), 'Review', decisions)
+    return credit_scores, decisions
+
+def estimate_loan_amount_batch(income, credit_scores):
+    multipliers = LOAN_MULTIPLIER_TABLE[np.searchsorted(LOAN_SCORE_TABLE, credit_scores, side='right')]
+    return np.round(np.asarray(income, dtype=np.float64) * multipliers, -3)
+
+def generate_message(decision, credit_score, amount=None):
+    if decision == 'Approved':
+        return f"✅ Congratulations! Your loan has been approved with a credit score of {credit_score}. The approved loan amount is **KES {amount:,.0f}**."
+    elif decision == 'Review':
+        if credit_score is None:
+            return "📋 Your loan application is under review. A loan officer will contact you shortly."
+        return f"📋 Your loan application is under review. A loan officer will contact you shortly. (Credit score: {credit_score})"
+    else:
+        return f"❌ We're sorry, your loan application was not approved at this time. (Credit score: {credit_score})"
+
+# Column dtypes of the application form, declared so the single-row frame
+# is built from typed arrays instead of pandas inferring each column
+APPLICATION_DTYPES = {
+    'Age_Group': object,
+    'Gender': object,
+    'Region': object,
+    'monthly_income': np.int64,
+    'Employment_Status': object,
+    'KCSE_Grade': object,
+    'Learning_Adaptability': object,
+    'Support_Services_Usage': object,
+    'Psychosocial_Support': object,
+    'repayment_history': object,
+    'has_collateral': bool,
+    'missing_documents': bool
+}
+
+def run_decision_engine(model, application):
+    if model is None:
+        return None
+
+    # Missing documents always go to manual review, so the model isn't run
+    if application['missing_documents']:
+        return {
+            'credit_score': None,
+            'decision': 'Review',
+            'loan_amount': None,
+            'probability': None,
+            'message': generate_message('Review', None)
+        }
+
+    # Single-row frame is only needed by the preprocessing step, which
+    # carries the encoders fitted at training time
+    input_df = pd.DataFrame(
+        {col: np.array([application[col]], dtype=dtype) for col, dtype in APPLICATION_DTYPES.items()},
+        copy=False
+    )
+
+    # Preprocess and predict probability in one pipeline call
+    try:
+        prob = model.predict_proba(input_df)[0][1]
+    except Exception as e:
+        st.error(f"Prediction error: {e}")
+        return None
+
+    # Use original (non-transformed) values for logic decisions
+    income = application['monthly_income']
+    repayment_code = REPAYMENT_CODES.get(application['repayment_history'], REPAYMENT_POOR)
+    has_collateral = application['has_collateral']
+    missing_docs = application['missing_documents']
+
+    # Business logic
+    credit_score, decision = decision_logic(prob, income, repayment_code, has_collateral, missing_docs)
+
+    approved_loan_amount = None
+    if decision == 'Approved':
+        approved_loan_amount = estimate_loan_amount(income, credit_score)
+
+    message = generate_message(decision, credit_score, approved_loan_amount)
+
+    return {
+        'credit_score': credit_score,
+        'decision': decision,
+        'loan_amount': approved_loan_amount,
+        'probability': round(prob, 4),
+        'message': message
+    }
+
+def run_decision_engine_batch(model, applications):
+    """Score a DataFrame of applications with one predict_proba call"""
+    if model is None:
+        return None
+
+    try:
+        # Keep only the positive-class column so the (N, 2) matrix is freed
+        probs = np.ascontiguousarray(model.predict_proba(applications)[:, 1])
+    except Exception as e:
+        st.error(f"Prediction error: {e}")
+        return None
+
+    missing_docs = applications['missing_documents'].to_numpy(dtype=bool)
+    credit_scores, decisions = decision_logic_batch(
+        probs,
+        applications['repayment_history'].map(REPAYMENT_CODES).fillna(REPAYMENT_POOR).to_numpy(np.int8),
+        applications['has_collateral'].to_numpy(),
+        missing_docs
+    )
+    loan_amounts = np.where(
+        decisions == 'Approved',
+        estimate_loan_amount_batch(applications['monthly_income'].to_numpy(), credit_scores),
+        np.nan
+    )
+
+    # Like run_decision_engine, missing-documents rows go to review with no
+    # score or probability reported
+    return pd.DataFrame({
+        'credit_score': pd.arrays.IntegerArray(credit_scores, missing_docs),
+        'decision': decisions,
+        'loan_amount': loan_amounts,
+        'probability': np.where(missing_docs, np.nan, probs.round(4))
+    }, index=applications.index)
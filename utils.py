@@ -1,28 +1,58 @@
+import atexit
 import bcrypt
+import functools
+import hashlib
+import hmac
 import logging
-import sqlite3
-from datetime import datetime
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 from config import *
+from db import get_pool
+
+# Configure logging: callers only enqueue records, and a background
+# listener thread formats and writes them to the file and the console
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler(LOG_FILE),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Flush pending records on shutdown
+
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Full format is applied by the listener
 
-# Configure logging
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
+    handlers=[_queue_handler]
 )
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=1)
+def get_argon2_hasher():
+    """argon2id hasher, imported on first use so bcrypt-only setups skip argon2"""
+    from argon2 import PasswordHasher
+    return PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+
 class SecurityUtils:
     """Security utilities for password hashing and validation"""
     
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash a password using bcrypt"""
+        """Hash a password using the configured scheme (bcrypt or argon2id)"""
         try:
+            if PASSWORD_HASHER == 'argon2id':
+                return get_argon2_hasher().hash(password)
             salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
             hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
             return hashed.decode('utf-8')
@@ -32,50 +62,118 @@ class SecurityUtils:
     
     @staticmethod
     def verify_password(password: str, hashed: str) -> bool:
-        """Verify a password against its hash"""
+        """Verify a password against a bcrypt or argon2id hash"""
         try:
+            # Dispatch on the hash prefix so stored bcrypt hashes keep working
+            # after switching PASSWORD_HASHER
+            if hashed.startswith('$argon2'):
+                from argon2.exceptions import VerificationError
+                try:
+                    return get_argon2_hasher().verify(hashed, password)
+                except VerificationError:
+                    return False
             return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
         except Exception as e:
             logger.error(f"Error verifying password: {e}")
             return False
+    
+    @staticmethod
+    def create_session_token(username: str) -> str:
+        """Create an HMAC-signed token proving a recent successful login"""
+        payload = f"{username}:{int(time.time()) + SESSION_TTL_SECONDS}"
+        signature = hmac.new(SECRET_KEY.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"{payload}:{signature}"
+    
+    @staticmethod
+    def verify_session_token(token: str, username: str) -> bool:
+        """Check a session token's signature, owner and expiry"""
+        try:
+            payload, signature = token.rsplit(':', 1)
+            token_username, expiry = payload.rsplit(':', 1)
+            expected = hmac.new(SECRET_KEY.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+            return (hmac.compare_digest(signature, expected)
+                    and token_username == username
+                    and int(expiry) > time.time())
+        except (AttributeError, ValueError):
+            return False
+
+class LoginRateLimiter:
+    """Rejects repeated failed logins per username before bcrypt runs"""
+    
+    def __init__(self, max_attempts: int = LOGIN_MAX_ATTEMPTS, window_seconds: int = LOGIN_LOCKOUT_SECONDS):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        # Fixed-size ring buffer of failure times per username
+        self._failures = defaultdict(lambda: deque(maxlen=max_attempts))
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+    
+    def is_blocked(self, username: str) -> bool:
+        """True while the username has max_attempts failures inside the window"""
+        with self._lock:
+            attempts = self._failures.get(username)
+            return (attempts is not None
+                    and len(attempts) == self.max_attempts
+                    and time.monotonic() - attempts[0] < self.window_seconds)
+    
+    def record_failure(self, username: str):
+        with self._lock:
+            now = time.monotonic()
+            self._failures[username].append(now)
+            
+            # Once per window, forget usernames whose latest failure has aged
+            # out; they can no longer contribute to a block
+            if now - self._last_prune >= self.window_seconds:
+                stale = [name for name, attempts in self._failures.items()
+                         if now - attempts[-1] >= self.window_seconds]
+                for name in stale:
+                    del self._failures[name]
+                self._last_prune = now
+    
+    def reset(self, username: str):
+        with self._lock:
+            self._failures.pop(username, None)
 
 class DatabaseUtils:
     """Database utilities with enhanced error handling and logging"""
     
     @staticmethod
-    def get_connection():
-        """Get database connection with error handling"""
+    @contextmanager
+    def get_connection(readonly: bool = False):
+        """Borrow a pooled connection; read-only ones don't wait on writes"""
         try:
-            conn = sqlite3.connect(DB_FILE)
-            conn.row_factory = sqlite3.Row  # Enable column access by name
-            return conn
+            pool = get_pool()
         except Exception as e:
             logger.error(f"Database connection error: {e}")
             raise
+        with pool.acquire(readonly=readonly) as conn:
+            yield conn
     
     @staticmethod
-    def execute_query(query: str, params: tuple = (), fetch_one: bool = False, fetch_all: bool = False):
-        """Execute database query with proper error handling"""
+    def execute_query(query: str, params: tuple = (), fetch_one: bool = False, fetch_all: bool = False,
+                      readonly: bool = False):
+        """Execute database query with proper error handling; pass readonly=True for plain SELECTs"""
         try:
-            with DatabaseUtils.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, params)
+            with DatabaseUtils.get_connection(readonly=readonly) as conn:
+                # Pooled connections autocommit each statement
+                cursor = conn.execute(query, params)
                 
                 if fetch_one:
                     return cursor.fetchone()
                 elif fetch_all:
                     return cursor.fetchall()
                 
-                conn.commit()
                 return cursor.rowcount
         except Exception as e:
             logger.error(f"Database query error: {e}")
             raise
 
+
 def log_user_action(username: str, action: str, details: str = ""):
     """Log user actions for audit trail"""
-    timestamp = datetime.now().isoformat()
-    logger.info(f"USER_ACTION - {timestamp} - {username} - {action} - {details}")
+    # The record's asctime is the timestamp; the message is only built
+    # when INFO is enabled
+    logger.info("USER_ACTION - %s - %s - %s", username, action, details)
 
 def validate_input(data: dict, required_fields: list) -> tuple:
     """Validate input data and return (is_valid, missing_fields)"""